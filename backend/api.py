@@ -1,25 +1,34 @@
 from typing import Any, List
-import shutil
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import aiofiles
+import numpy as np
+import orjson
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
+from backend.batching import query_embedder
 from backend.config import settings
 from backend.ingest import ingest
-from backend.rag import generate_answer, search, summarize_document, generate_quiz
-
-app = FastAPI(title="Smart Campus Assistant API", version="0.1.0")
-
-# Add CORS middleware to allow frontend to call backend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from backend.rag import (
+    QUIZ_QUERY,
+    SUMMARY_QUERY,
+    encode_query,
+    generate_answer_async,
+    generate_quiz,
+    index_version,
+    load_index,
+    search,
+    search_many,
+    stream_answer,
+    summarize_document,
 )
+from backend.semcache import semantic_cache
 
 
 class QueryRequest(BaseModel):
@@ -53,6 +62,40 @@ class QuizResponse(BaseModel):
     sources: List[dict[str, Any]]
 
 
+def _warm_up() -> None:
+    """Load the embedding model and index so the first request doesn't pay for it"""
+    # Also precomputes the canned summary/quiz query embeddings
+    for canned in (SUMMARY_QUERY, QUIZ_QUERY):
+        encode_query(canned)
+    try:
+        load_index()
+    except FileNotFoundError:
+        pass  # Nothing ingested yet
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(_warm_up)
+    query_embedder.start()
+    yield
+    await query_embedder.stop()
+
+
+app = FastAPI(title="Smart Campus Assistant API", version="0.1.0", lifespan=lifespan)
+
+# Add CORS middleware to allow frontend to call backend
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, replace with specific origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok"}
@@ -62,9 +105,10 @@ def health() -> dict[str, str]:
 
 
 @app.post("/ingest")
-def ingest_docs() -> dict[str, str]:
+async def ingest_docs() -> dict[str, str]:
     try:
-        ingest()
+        await asyncio.to_thread(ingest)
+        semantic_cache.clear()  # Cached answers refer to the old corpus
         return {"status": "ingested", "message": "Documents successfully ingested"}
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc))
@@ -74,13 +118,22 @@ def ingest_docs() -> dict[str, str]:
         raise HTTPException(status_code=500, detail=f"Error during ingestion: {str(exc)}")
 
 
-@app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest) -> QueryResponse:
+async def _encode_question(req: QueryRequest) -> tuple[str, int, np.ndarray]:
     if not req.question or not req.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
-    
+
+    question = req.question.strip()
+    top_k = req.top_k or settings.top_k
     try:
-        contexts = search(req.question.strip(), req.top_k or settings.top_k)
+        query_vec = await query_embedder.aencode(question)
+    except ValueError as exc:
+        raise HTTPException(status_code=500, detail=f"Search error: {str(exc)}")
+    return question, top_k, query_vec
+
+
+async def _search_contexts(question: str, top_k: int, query_vec: np.ndarray) -> List[dict[str, Any]]:
+    try:
+        contexts = await asyncio.to_thread(search, question, top_k, query_vec=query_vec)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except ValueError as exc:
@@ -90,59 +143,187 @@ def query(req: QueryRequest) -> QueryResponse:
 
     if not contexts:
         raise HTTPException(status_code=404, detail="No context found. Ingest documents first.")
+    return contexts
+
+
+def _sse(data: str, event: str | None = None) -> str:
+    """Format one Server-Sent Event; multi-line data needs a data: prefix per line"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest) -> QueryResponse:
+    question, top_k, query_vec = await _encode_question(req)
+
+    version = index_version()
+    cached = semantic_cache.lookup(query_vec, top_k, version)
+    if cached is not None:
+        return QueryResponse(answer=cached["answer"], sources=cached["sources"])
+
+    contexts = await _search_contexts(question, top_k, query_vec)
 
     try:
-        answer = generate_answer(req.question.strip(), contexts)
+        answer = await generate_answer_async(question, contexts)
     except ValueError as exc:
         raise HTTPException(status_code=500, detail=f"Answer generation error: {str(exc)}")
     except Exception as exc:
         error_msg = str(exc)
         # Don't expose full traceback to frontend, but log it
-        import logging
         logging.error(f"Error generating answer: {error_msg}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error generating answer: {error_msg}")
 
+    semantic_cache.add(query_vec, top_k, answer, contexts, version)
     return QueryResponse(answer=answer, sources=contexts)
 
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)) -> dict[str, str]:
-    """Upload a file to the data directory"""
-    allowed_extensions = {".pdf", ".txt", ".md", ".docx", ".doc", ".pptx", ".ppt"}
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest) -> StreamingResponse:
+    """Stream the answer as Server-Sent Events: a sources event, answer tokens, then done"""
+    question, top_k, query_vec = await _encode_question(req)
+
+    version = index_version()
+    cached = semantic_cache.lookup(query_vec, top_k, version)
+    if cached is not None:
+        contexts = cached["sources"]
+    else:
+        contexts = await _search_contexts(question, top_k, query_vec)
+
+    async def events():
+        yield _sse(orjson.dumps(contexts).decode(), event="sources")
+        if cached is not None:
+            yield _sse(cached["answer"])
+            yield _sse("", event="done")
+            return
+        parts = []
+        try:
+            async for token in stream_answer(question, contexts):
+                parts.append(token)
+                yield _sse(token)
+        except Exception as exc:
+            logging.error(f"Error streaming answer: {str(exc)}", exc_info=True)
+            yield _sse(f"Error generating answer: {str(exc)}", event="error")
+            return
+        answer = "".join(parts).strip()
+        if answer:
+            semantic_cache.add(query_vec, top_k, answer, contexts, version)
+        yield _sse("", event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+ALLOWED_EXTENSIONS = {".pdf", ".txt", ".md", ".docx", ".doc", ".pptx", ".ppt"}
+MULTIPART_OVERHEAD = 64 * 1024  # Boundaries and part headers around the file bytes
+
+
+def _upload_request_limit(path: str) -> int | None:
+    """Largest request body accepted on an upload route, or None for other routes"""
+    if path == "/upload":
+        return settings.max_upload_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+    if path == "/upload/batch":
+        return settings.max_batch_upload_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+    return None
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads by Content-Length, before Starlette spools the form to disk"""
+    limit = _upload_request_limit(request.url.path) if request.method == "POST" else None
+    if limit is not None:
+        length = request.headers.get("content-length")
+        if length is None:
+            return JSONResponse(status_code=411, content={"detail": "Uploads must send a Content-Length header"})
+        if not length.isdigit() or int(length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload is larger than the {limit // (1024 * 1024)} MB request limit"},
+            )
+    return await call_next(request)
+
+
+def _too_large(file: UploadFile) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File {file.filename} is larger than the {settings.max_upload_mb} MB upload limit"
+    )
+
+
+def _check_upload(file: UploadFile) -> None:
+    """Reject unsupported or oversized files before copying anything into the data directory"""
     file_ext = Path(file.filename).suffix.lower()
     
-    if file_ext not in allowed_extensions:
+    if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"File type {file_ext} not supported. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"File type {file_ext} not supported. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
+    if file.size is not None and file.size > settings.max_upload_mb * 1024 * 1024:
+        raise _too_large(file)
+
+
+async def _save_upload(file: UploadFile) -> None:
+    """Write an uploaded file to the data directory"""
+    max_bytes = settings.max_upload_mb * 1024 * 1024
     try:
         data_dir = Path(settings.data_dir)
         data_dir.mkdir(parents=True, exist_ok=True)
         
         file_path = data_dir / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        return {
-            "status": "uploaded",
-            "filename": file.filename,
-            "message": f"File {file.filename} uploaded successfully"
-        }
+        # Copy in chunks without blocking the event loop; enforce the limit as we go
+        # too, since Starlette may not have recorded the size
+        written = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    break
+                await buffer.write(chunk)
+        if written > max_bytes:
+            file_path.unlink(missing_ok=True)
+            raise _too_large(file)
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(exc)}")
 
 
+@app.post("/upload")
+async def upload_file(file: UploadFile = File(...)) -> dict[str, str]:
+    """Upload a file to the data directory"""
+    _check_upload(file)
+    await _save_upload(file)
+    return {
+        "status": "uploaded",
+        "filename": file.filename,
+        "message": f"File {file.filename} uploaded successfully"
+    }
+
+
+@app.post("/upload/batch")
+async def upload_files(files: List[UploadFile] = File(...)) -> dict[str, Any]:
+    """Upload several files to the data directory in one request"""
+    for file in files:
+        _check_upload(file)
+    for file in files:
+        await _save_upload(file)
+    return {
+        "status": "uploaded",
+        "filenames": [file.filename for file in files],
+        "message": f"{len(files)} files uploaded successfully"
+    }
+
+
 @app.post("/summarize", response_model=SummarizeResponse)
-def summarize(req: SummarizeRequest) -> SummarizeResponse:
+async def summarize(req: SummarizeRequest) -> SummarizeResponse:
     """Summarize documents based on query or all documents"""
     try:
         if req.query:
-            contexts = search(req.query.strip(), top_k=10)
+            contexts = await asyncio.to_thread(search, req.query.strip(), top_k=10)
         else:
             # Get top contexts from all documents
-            contexts = search("summary overview main points", top_k=10)
+            contexts = await asyncio.to_thread(search, SUMMARY_QUERY, top_k=10)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except ValueError as exc:
@@ -154,7 +335,7 @@ def summarize(req: SummarizeRequest) -> SummarizeResponse:
         raise HTTPException(status_code=404, detail="No context found. Ingest documents first.")
 
     try:
-        summary = summarize_document(contexts, max_length=req.max_length)
+        summary = await asyncio.to_thread(summarize_document, contexts, max_length=req.max_length)
     except ValueError as exc:
         raise HTTPException(status_code=500, detail=f"Summarization error: {str(exc)}")
     except Exception as exc:
@@ -164,7 +345,7 @@ def summarize(req: SummarizeRequest) -> SummarizeResponse:
 
 
 @app.post("/quiz", response_model=QuizResponse)
-def create_quiz(req: QuizRequest) -> QuizResponse:
+async def create_quiz(req: QuizRequest) -> QuizResponse:
     """Generate a quiz based on query or all documents"""
     if req.num_questions < 1 or req.num_questions > 20:
         raise HTTPException(status_code=400, detail="Number of questions must be between 1 and 20")
@@ -176,20 +357,23 @@ def create_quiz(req: QuizRequest) -> QuizResponse:
         if req.query and req.query.strip():
             # Use the specific topic query for better relevance
             query_text = req.query.strip()
-            # Search with the topic query to get relevant contexts
-            contexts = search(query_text, top_k=20)  # Get more contexts for better quiz generation
+            # Search the topic and general queries together; the general results are
+            # only used when the topic yields too few contexts
+            contexts, general_contexts = await asyncio.to_thread(
+                search_many, [query_text, QUIZ_QUERY], top_k=20  # Get more contexts for better quiz generation
+            )
             # If not enough relevant contexts, supplement with general search
             if len(contexts) < 5:
-                general_contexts = search("important concepts key points main ideas", top_k=10)
-                # Merge and deduplicate
-                seen_texts = {c["text"][:100] for c in contexts}
+                general_contexts = general_contexts[:10]
+                # Merge and deduplicate by chunk id
+                seen_ids = {c["id"] for c in contexts}
                 for ctx in general_contexts:
-                    if ctx["text"][:100] not in seen_texts:
+                    if ctx["id"] not in seen_ids:
                         contexts.append(ctx)
-                        seen_texts.add(ctx["text"][:100])
+                        seen_ids.add(ctx["id"])
         else:
             # Get top contexts from all documents
-            contexts = search("important concepts key points main ideas", top_k=20)
+            contexts = await asyncio.to_thread(search, QUIZ_QUERY, top_k=20)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except ValueError as exc:
@@ -202,7 +386,7 @@ def create_quiz(req: QuizRequest) -> QuizResponse:
 
     try:
         topic = req.query.strip() if req.query and req.query.strip() else None
-        quiz = generate_quiz(contexts, num_questions=req.num_questions, difficulty=req.difficulty, topic=topic)
+        quiz = await asyncio.to_thread(generate_quiz, contexts, num_questions=req.num_questions, difficulty=req.difficulty, topic=topic)
     except ValueError as exc:
         raise HTTPException(status_code=500, detail=f"Quiz generation error: {str(exc)}")
     except Exception as exc:
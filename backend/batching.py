@@ -0,0 +1,81 @@
+import asyncio
+from typing import List
+
+import numpy as np
+
+from backend.rag import Embedder, cached_query_embedding, encode_query, remember_query_embedding
+
+
+# -----------------------------
+# DYNAMIC QUERY MICRO-BATCHING
+# -----------------------------
+class BatchingEmbedder:
+    """Coalesces concurrent single-query encodes into one model call.
+
+    Requests wait at most max_wait_ms for company before their batch is encoded.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._queue = None
+
+    async def aencode(self, query: str) -> np.ndarray:
+        query_vec = cached_query_embedding(query)
+        if query_vec is not None:
+            return query_vec
+        if self._queue is None:
+            # Not started (e.g. no lifespan), encode on its own
+            return await asyncio.to_thread(encode_query, query)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        query_vec = await future
+        remember_query_embedding(query, query_vec)
+        return query_vec
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._encode_batch(batch)
+
+    @staticmethod
+    async def _encode_batch(batch: List[tuple[str, asyncio.Future]]) -> None:
+        try:
+            vectors = await asyncio.to_thread(Embedder.encode, [query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (_, future) in enumerate(batch):
+            if not future.done():  # The caller may have gone away
+                # Copy, so the cached row doesn't keep the whole batch array alive
+                future.set_result(vectors[i:i + 1].copy())
+
+
+query_embedder = BatchingEmbedder()
@@ -4,11 +4,16 @@ from pydantic import Field
 class Settings(BaseSettings):
     groq_api_key: str = Field("", env="GROQ_API_KEY")   # ✅ NEW
     embedding_model: str = Field("all-MiniLM-L6-v2", env="EMBEDDING_MODEL")  # Local embedding model (sentence-transformers)
+    onnx_model_path: str = Field("", env="ONNX_MODEL_PATH")  # Optional int8 ONNX export of the embedding model
     llm_model: str = Field("llama-3.1-8b-instant", env="LLM_MODEL")  # ⭐ Recommended Groq model
     top_k: int = Field(4, env="TOP_K")
     chunk_size: int = Field(500, env="CHUNK_SIZE")
     chunk_overlap: int = Field(80, env="CHUNK_OVERLAP")
+    semcache_threshold: float = Field(0.97, env="SEMCACHE_THRESHOLD")  # Cosine similarity for a cache hit
+    semcache_max_entries: int = Field(5000, env="SEMCACHE_MAX_ENTRIES")
     data_dir: str = Field("data", env="DATA_DIR")
+    max_upload_mb: int = Field(50, env="MAX_UPLOAD_MB")
+    max_batch_upload_mb: int = Field(200, env="MAX_BATCH_UPLOAD_MB")  # Whole /upload/batch request
     embeddings_dir: str = Field("embeddings", env="EMBEDDINGS_DIR")
     index_file: str = Field("embeddings/index.faiss", env="INDEX_FILE")
     metadata_file: str = Field("embeddings/meta.json", env="METADATA_FILE")
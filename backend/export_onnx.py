@@ -0,0 +1,52 @@
+import argparse
+from pathlib import Path
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from backend.rag import Embedder
+
+
+def export_onnx(output: Path) -> None:
+    """Export the embedding model to ONNX and quantize its weights to int8"""
+    # Only needed for the export and for serving the ONNX model
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    st_model = SentenceTransformer(Embedder.model_name(), device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    # Embedder truncates to the tokenizer limit, so carry over the sentence-transformers one
+    tokenizer.model_max_length = st_model.max_seq_length
+
+    dummy = tokenizer(["warmup"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    fp32_path = output.with_name(f"{output.stem}-fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+            # torch>=2.9 defaults to the dynamo exporter, which needs onnxscript and opset>=18
+            dynamo=False,
+        )
+
+    quantize_dynamic(str(fp32_path), str(output), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+    tokenizer.save_pretrained(str(output.parent))
+    print(f"Exported int8 ONNX model to {output}. Set ONNX_MODEL_PATH={output} to use it.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX.")
+    parser.add_argument("--output", default="onnx/minilm-int8.onnx", help="Path of the quantized ONNX model.")
+    args = parser.parse_args()
+    export_onnx(Path(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,43 @@
 import argparse
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable, List
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from pypdf import PdfReader
-import docx2txt
-from pptx import Presentation
 
 from backend.config import settings
-from backend.rag import build_index
-
-
-def load_text_from_pdf(path: Path) -> str:
-    reader = PdfReader(str(path))
-    pages = []
-    for page in reader.pages:
-        text = page.extract_text() or ""
-        pages.append(text)
-    return "\n".join(pages)
-
-
-def load_text_from_docx(path: Path) -> str:
-    """Extract text from .docx file"""
-    try:
-        return docx2txt.process(str(path))
-    except Exception as e:
-        raise ValueError(f"Error reading DOCX file {path}: {str(e)}")
-
-
-def load_text_from_pptx(path: Path) -> str:
-    """Extract text from .pptx file"""
-    try:
-        prs = Presentation(str(path))
-        text_runs = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text_runs.append(shape.text)
-        return "\n".join(text_runs)
-    except Exception as e:
-        raise ValueError(f"Error reading PPTX file {path}: {str(e)}")
+from backend.parsing import SUPPORTED_SUFFIXES, chunk_file
 
 
-def iter_documents(data_dir: Path) -> Iterable[tuple[str, str]]:
-    for file in data_dir.glob("**/*"):
-        if file.is_dir():
-            continue
-        suffix = file.suffix.lower()
-        if suffix in {".txt", ".md"}:
-            yield file.name, file.read_text(encoding="utf-8", errors="ignore")
-        elif suffix == ".pdf":
-            yield file.name, load_text_from_pdf(file)
-        elif suffix in {".docx", ".doc"}:
-            yield file.name, load_text_from_docx(file)
-        elif suffix in {".pptx", ".ppt"}:
-            yield file.name, load_text_from_pptx(file)
-
-
-def chunk_documents(docs: Iterable[tuple[str, str]]) -> List[dict]:
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap,
-        separators=["\n\n", "\n", ". ", " "],
-    )
-    chunks: List[dict] = []
-    for source, text in docs:
-        if not text.strip():
-            continue
-        for i, chunk in enumerate(splitter.split_text(text)):
-            chunks.append(
-                {
-                    "id": f"{source}_{i}",
-                    "text": chunk.strip(),
-                    "source": source,
-                }
-            )
-    return chunks
+# Below this many files, parsing in-process is faster than starting workers
+PARALLEL_MIN_FILES = 8
 
 
 def ingest(data_dir: str | Path = settings.data_dir) -> None:
     data_dir = Path(data_dir)
     if not data_dir.exists():
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
-    docs = list(iter_documents(data_dir))
-    if not docs:
+    paths = [
+        f for f in data_dir.glob("**/*")
+        if not f.is_dir() and f.suffix.lower() in SUPPORTED_SUFFIXES
+    ]
+    if not paths:
+        raise RuntimeError("No documents found to ingest.")
+    if len(paths) < PARALLEL_MIN_FILES:
+        chunks = [c for file in paths for c in chunk_file(file)]
+    else:
+        # Parsing (especially PDFs) and splitting are CPU-bound, so spread files across cores.
+        # Workers return chunks rather than full text, so no process holds a whole corpus.
+        # Spawned workers only import backend.parsing, and no threaded server gets forked.
+        with ProcessPoolExecutor(
+            max_workers=min(len(paths), os.cpu_count() or 1),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as ex:
+            chunks = [c for file_chunks in ex.map(chunk_file, paths) for c in file_chunks]
+    if not chunks:
         raise RuntimeError("No documents found to ingest.")
-    chunks = chunk_documents(docs)
+    # Imported here so spawned workers re-importing this module skip torch and faiss
+    from backend.rag import build_index
+
     build_index(chunks)
     print(f"Ingestion complete. Chunks: {len(chunks)}")
 
@@ -100,5 +51,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,159 @@
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+import numpy as np
+from pypdf import PdfReader
+import docx2txt
+from pptx import Presentation
+
+from backend.config import settings
+
+
+# Kept free of backend.rag (torch, faiss, ...) so ingest worker processes start quickly
+
+SUPPORTED_SUFFIXES = {".txt", ".md", ".pdf", ".docx", ".doc", ".pptx", ".ppt"}
+
+
+def iter_text_from_pdf(path: Path) -> Iterator[str]:
+    """Yield the text of a .pdf file one page at a time"""
+    reader = PdfReader(str(path))
+    for page in reader.pages:
+        yield (page.extract_text() or "") + "\n"
+
+
+def iter_text_from_txt(path: Path, block_size: int = 1 << 16) -> Iterator[str]:
+    """Yield the text of a .txt/.md file in fixed-size blocks"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        while block := f.read(block_size):
+            yield block
+
+
+def load_text_from_docx(path: Path) -> str:
+    """Extract text from .docx file"""
+    try:
+        return docx2txt.process(str(path))
+    except Exception as e:
+        raise ValueError(f"Error reading DOCX file {path}: {str(e)}")
+
+
+def iter_text_from_pptx(path: Path) -> Iterator[str]:
+    """Yield the text of a .pptx file one slide at a time"""
+    try:
+        prs = Presentation(str(path))
+        for slide in prs.slides:
+            yield "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text")) + "\n"
+    except Exception as e:
+        raise ValueError(f"Error reading PPTX file {path}: {str(e)}")
+
+
+def iter_document_text(file: Path) -> Iterator[str]:
+    """Yield a supported file's text piece by piece (pages, slides or blocks)"""
+    suffix = file.suffix.lower()
+    if suffix in {".txt", ".md"}:
+        yield from iter_text_from_txt(file)
+    elif suffix == ".pdf":
+        yield from iter_text_from_pdf(file)
+    elif suffix in {".docx", ".doc"}:
+        yield load_text_from_docx(file)
+    elif suffix in {".pptx", ".ppt"}:
+        yield from iter_text_from_pptx(file)
+
+
+def _last_before(positions: np.ndarray, lo: int, hi: int) -> int:
+    """Largest position in (lo, hi], or -1"""
+    i = np.searchsorted(positions, hi, side="right") - 1
+    return int(positions[i]) if i >= 0 and positions[i] > lo else -1
+
+
+def _split_spans(text: str) -> List[tuple[int, int]]:
+    """(start, end) offsets of the chunk windows of text, before stripping.
+
+    Like RecursiveCharacterTextSplitter, each chunk ends at the latest paragraph break
+    that fits, else line break, else sentence end, else space, else mid-word. Separator
+    offsets are found once with NumPy instead of by repeated string splitting.
+    """
+    chunk_size, overlap = settings.chunk_size, settings.chunk_overlap
+    n = len(text)
+    # UTF-32 gives one array element per character, so offsets index the str directly
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    newline, space, dot = codes == ord("\n"), codes == ord(" "), codes == ord(".")
+    boundaries = [
+        np.flatnonzero(newline[:-1] & newline[1:]),  # "\n\n"
+        np.flatnonzero(newline),  # "\n"
+        np.flatnonzero(dot[:-1] & space[1:]) + 1,  # ". " (the period stays with its sentence)
+        np.flatnonzero(space),  # " "
+    ]
+    whitespace = np.flatnonzero(newline | space)
+
+    spans = []
+    start = 0
+    while start < n:
+        end = start + chunk_size
+        if end >= n:
+            split = n
+        else:
+            # Split far enough in that the overlap still moves the window forward
+            split = end
+            for positions in boundaries:
+                candidate = _last_before(positions, start + overlap, end)
+                if candidate != -1:
+                    split = candidate
+                    break
+        spans.append((start, split))
+        if split >= n:
+            break
+        # Start the next chunk at a word boundary about `overlap` characters back
+        next_start = split - overlap
+        i = np.searchsorted(whitespace, next_start)
+        if i < len(whitespace) and whitespace[i] < split:
+            next_start = int(whitespace[i]) + 1
+        start = next_start if next_start > start else split
+    return spans
+
+
+def split_text(text: str) -> List[str]:
+    """Split text into chunks of at most chunk_size characters with ~chunk_overlap overlap"""
+    chunks = (text[start:end].strip() for start, end in _split_spans(text))
+    return [chunk for chunk in chunks if chunk]
+
+
+def _split_stream(pieces: Iterable[str]) -> Iterator[str]:
+    """Split a document arriving piece by piece without holding all of it in memory.
+
+    Pieces are concatenated as-is (page and slide readers end theirs with a newline).
+    The raw text of the last window of each round is carried over and re-split with
+    the next piece, so chunks match splitting the joined text closely.
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) <= settings.chunk_size:
+            continue
+        spans = _split_spans(buffer)
+        for start, end in spans[:-1]:
+            chunk = buffer[start:end].strip()
+            if chunk:
+                yield chunk
+        buffer = buffer[spans[-1][0]:]
+    if buffer.strip():
+        yield from split_text(buffer)
+
+
+def chunk_documents(docs: Iterable[tuple[str, str]]) -> List[dict]:
+    chunks: List[dict] = []
+    for source, pieces in groupby(docs, key=lambda doc: doc[0]):
+        for i, chunk in enumerate(_split_stream(text for _, text in pieces)):
+            chunks.append(
+                {
+                    "id": f"{source}_{i}",
+                    "text": chunk.strip(),
+                    "source": source,
+                }
+            )
+    return chunks
+
+
+def chunk_file(file: Path) -> List[dict]:
+    """Parse and split one file; runs in ingest worker processes"""
+    return chunk_documents((file.name, text) for text in iter_document_text(file))
@@ -1,11 +1,16 @@
-import json
 import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import List, Tuple
+from typing import AsyncIterator, List, Tuple
 
 import faiss
+import httpx
 import numpy as np
-from groq import Groq
+import orjson
+from groq import AsyncGroq, Groq
 from sentence_transformers import SentenceTransformer
 
 from backend.config import settings
@@ -16,7 +21,12 @@ from backend.config import settings
 # -----------------------------
 class Embedder:
     _model: SentenceTransformer | None = None
+    # Shared so every request reuses the same pooled HTTPS connections to Groq
     _groq_client: Groq | None = None
+    _async_groq_client: AsyncGroq | None = None
+    _onnx_session = None  # onnxruntime.InferenceSession, when ONNX_MODEL_PATH is set
+    _tokenizer = None
+    _use_onnx: bool | None = None
 
     @classmethod
     def get_groq_client(cls) -> Groq:
@@ -26,28 +36,97 @@ class Embedder:
             cls._groq_client = Groq(api_key=settings.groq_api_key)
         return cls._groq_client
 
+    @classmethod
+    def get_async_groq_client(cls) -> AsyncGroq:
+        if cls._async_groq_client is None:
+            if not settings.groq_api_key:
+                raise ValueError("GROQ_API_KEY is not set. Please set it in your .env file.")
+            cls._async_groq_client = AsyncGroq(
+                api_key=settings.groq_api_key,
+                http_client=httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20)),
+            )
+        return cls._async_groq_client
+
     @classmethod
     def use_groq(cls):
         # Groq embeddings API may not be available, so use local embeddings by default
         return False  # Disable Groq embeddings, use local model instead
 
+    @classmethod
+    def use_onnx(cls) -> bool:
+        # Use the exported int8 ONNX model when configured (see backend/export_onnx.py).
+        # Decided once; a missing model is an error, since falling back to PyTorch would
+        # silently produce embeddings that don't match an index built with ONNX.
+        if cls._use_onnx is None:
+            if settings.onnx_model_path and not Path(settings.onnx_model_path).exists():
+                raise ValueError(
+                    f"ONNX_MODEL_PATH {settings.onnx_model_path} does not exist. "
+                    "Run backend/export_onnx.py or unset it."
+                )
+            cls._use_onnx = bool(settings.onnx_model_path)
+        return cls._use_onnx
+
+    @classmethod
+    def model_name(cls) -> str:
+        model_name = settings.embedding_model
+        # Ensure we're using a valid sentence-transformers model
+        # Remove any incorrect prefixes if present
+        if model_name.startswith("sentence-transformers/"):
+            model_name = model_name.replace("sentence-transformers/", "")
+        # If it's still an invalid name, use the default
+        if "nomic-embed-text" in model_name.lower() or model_name == "nomic-embed-text":
+            model_name = "all-MiniLM-L6-v2"
+            print(f"Warning: Invalid embedding model detected. Using default: {model_name}")
+        return model_name
+
+    @classmethod
+    def get_onnx_session(cls):
+        if cls._onnx_session is None:
+            # Optional dependencies, only needed when ONNX_MODEL_PATH is set
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            # The export script saves the tokenizer next to the model
+            cls._tokenizer = AutoTokenizer.from_pretrained(str(Path(settings.onnx_model_path).parent))
+            cls._onnx_session = ort.InferenceSession(
+                settings.onnx_model_path, sess_options=sess_options, providers=["CPUExecutionProvider"]
+            )
+        return cls._onnx_session, cls._tokenizer
+
+    @classmethod
+    def _encode_onnx(cls, texts: List[str], batch_size: int) -> np.ndarray:
+        session, tokenizer = cls.get_onnx_session()
+        input_names = [i.name for i in session.get_inputs()]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=tokenizer.model_max_length,
+                return_tensors="np",
+            )
+            token_embeddings = session.run(None, {name: encoded[name] for name in input_names})[0]
+            # Mean-pool over real (non-padding) tokens, as sentence-transformers does
+            mask = encoded["attention_mask"][..., None].astype("float32")
+            batches.append((token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+        embeddings = np.concatenate(batches).astype("float32", copy=False)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
     @classmethod
     def get_model(cls):
         if cls._model is None:
-            model_name = settings.embedding_model
-            # Ensure we're using a valid sentence-transformers model
-            # Remove any incorrect prefixes if present
-            if model_name.startswith("sentence-transformers/"):
-                model_name = model_name.replace("sentence-transformers/", "")
-            # If it's still an invalid name, use the default
-            if "nomic-embed-text" in model_name.lower() or model_name == "nomic-embed-text":
-                model_name = "all-MiniLM-L6-v2"
-                print(f"Warning: Invalid embedding model detected. Using default: {model_name}")
-            cls._model = SentenceTransformer(model_name)
+            model = SentenceTransformer(cls.model_name())
+            if model.device.type == "cuda":
+                model.half()  # FP16 inference on GPU
+            cls._model = model
         return cls._model
 
     @classmethod
-    def encode(cls, texts: List[str]) -> np.ndarray:
+    def encode(cls, texts: List[str], batch_size: int = 32) -> np.ndarray:
         if not texts or not any(t.strip() for t in texts):
             raise ValueError("Cannot encode empty texts")
         
@@ -70,10 +149,22 @@ class Embedder:
             except Exception as e:
                 raise ValueError(f"Groq embedding API error: {str(e)}")
 
+        if cls.use_onnx():
+            try:
+                return cls._encode_onnx(texts, batch_size)
+            except Exception as e:
+                raise ValueError(f"ONNX embedding model error: {str(e)}")
+
         # Local model
         try:
             model = cls.get_model()
-            embeddings = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+            embeddings = model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
             return np.array(embeddings, dtype="float32")
         except Exception as e:
             raise ValueError(f"Local embedding model error: {str(e)}")
@@ -81,64 +172,189 @@ class Embedder:
 # -----------------------------
 # FAISS INDEX HANDLING
 # -----------------------------
+HNSW_MIN_CHUNKS = 2000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+IVFPQ_MIN_CHUNKS = 10000
+IVFPQ_M = 48  # PQ sub-quantizers; must divide the embedding dimension (384)
+IVFPQ_NPROBE = 16
+
+
+# Loaded index and metadata, reused until the files on disk change
+_index_cache: dict = {}
+
+
+def index_version() -> Tuple[float, float] | None:
+    """Modification times of the index files (changed by every ingest), or None if missing"""
+    try:
+        return os.stat(settings.index_file).st_mtime, os.stat(settings.metadata_file).st_mtime
+    except FileNotFoundError:
+        return None
+
+
 def load_index() -> Tuple[faiss.Index, list]:
-    if not Path(settings.index_file).exists() or not Path(settings.metadata_file).exists():
+    mtime = index_version()
+    if mtime is None:
         raise FileNotFoundError("Index or metadata missing. Run ingestion first.")
+    if _index_cache.get("mtime") == mtime:
+        return _index_cache["index"], _index_cache["metadata"]
+    # No IO_FLAG_MMAP: it only affects IVF indexes, and its on-disk reader is missing
+    # from Windows builds of faiss
     index = faiss.read_index(settings.index_file)
-    with open(settings.metadata_file, "r", encoding="utf-8") as f:
-        metadata = json.load(f)
+    metadata = orjson.loads(Path(settings.metadata_file).read_bytes())
+    _index_cache.update(mtime=mtime, index=index, metadata=metadata)
     return index, metadata
 
 
 def save_index(index: faiss.Index, metadata: list) -> None:
     Path(settings.embeddings_dir).mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, settings.index_file)
-    with open(settings.metadata_file, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    # Write to temp files and swap them in, so a search never sees a half-written file
+    tmp_index = f"{settings.index_file}.tmp"
+    tmp_metadata = f"{settings.metadata_file}.tmp"
+    faiss.write_index(index, tmp_index)
+    Path(tmp_metadata).write_bytes(orjson.dumps(metadata))
+    os.replace(tmp_index, settings.index_file)
+    os.replace(tmp_metadata, settings.metadata_file)
 
 
 def build_index(chunks: List[dict]) -> None:
     texts = [c["text"] for c in chunks]
-    embeddings = Embedder.encode(texts)
+    # Encode in length order so each batch pads to similar lengths, then restore order
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_embeddings = Embedder.encode([texts[i] for i in order], batch_size=128)
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    embeddings = embeddings.astype("float32")
     dim = embeddings.shape[1]
-    # IndexFlatIP works with normalized vectors (inner product = cosine similarity)
-    index = faiss.IndexFlatIP(dim)
+    # All indexes use inner product on normalized vectors (= cosine similarity).
+    # Vectors are stored as 8-bit codes, which costs <1% recall on MiniLM embeddings.
+    if len(chunks) < HNSW_MIN_CHUNKS:
+        # Brute force is fast enough for small corpora
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif len(chunks) < IVFPQ_MIN_CHUNKS or dim % IVFPQ_M:
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        nlist = int(np.sqrt(len(chunks)))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, IVFPQ_M, 8, faiss.METRIC_INNER_PRODUCT)
     # Ensure embeddings are normalized (Embedder.encode should handle this)
-    index.add(embeddings.astype("float32"))
+    index.train(embeddings)
+    index.add(embeddings)
     save_index(index, chunks)
+    _index_cache.clear()
+
+
+# Fixed queries used by /summarize and /quiz when no topic is given
+SUMMARY_QUERY = "summary overview main points"
+QUIZ_QUERY = "important concepts key points main ideas"
+
+# Their embeddings never change, so they are computed once and kept out of the LRU
+_CANNED: dict[str, np.ndarray] = {}
+
+# Recently seen user queries, most recent last
+QUERY_CACHE_SIZE = 256
+_query_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def cached_query_embedding(query: str) -> np.ndarray | None:
+    """Return the stored embedding of a canned or recently seen query, if any"""
+    if query in _CANNED:
+        return _CANNED[query]
+    with _query_cache_lock:
+        query_vec = _query_cache.get(query)
+        if query_vec is not None:
+            _query_cache.move_to_end(query)
+        return query_vec
+
+
+def remember_query_embedding(query: str, query_vec: np.ndarray) -> None:
+    if query in (SUMMARY_QUERY, QUIZ_QUERY):
+        _CANNED[query] = query_vec
+        return
+    with _query_cache_lock:
+        _query_cache[query] = query_vec
+        _query_cache.move_to_end(query)
+        if len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
 
 
-def search(query: str, top_k: int) -> List[dict]:
+def encode_query(query: str) -> np.ndarray:
+    """Embed a single query, reusing embeddings of canned and recently seen queries"""
+    query_vec = cached_query_embedding(query)
+    if query_vec is None:
+        query_vec = Embedder.encode([query])
+        remember_query_embedding(query, query_vec)
+    return query_vec
+
+
+def search(query: str, top_k: int, query_vec: np.ndarray | None = None) -> List[dict]:
     if not query or not query.strip():
         raise ValueError("Query cannot be empty")
     
+    if query_vec is None:
+        try:
+            query_vec = encode_query(query)
+        except Exception as e:
+            raise ValueError(f"Failed to encode query: {str(e)}")
+
+    return _search_vecs(query_vec, top_k)[0]
+
+
+def search_many(queries: List[str], top_k: int) -> List[List[dict]]:
+    """Search several queries with one encode call and one FAISS call"""
+    if not queries or not all(q and q.strip() for q in queries):
+        raise ValueError("Query cannot be empty")
+
+    query_vecs = [cached_query_embedding(q) for q in queries]
+    missing = [i for i, v in enumerate(query_vecs) if v is None]
+    if missing:
+        try:
+            encoded = Embedder.encode([queries[i] for i in missing])
+        except Exception as e:
+            raise ValueError(f"Failed to encode query: {str(e)}")
+        for row, i in enumerate(missing):
+            # Copy, so the cached row doesn't keep the whole batch array alive
+            query_vecs[i] = encoded[row:row + 1].copy()
+            remember_query_embedding(queries[i], query_vecs[i])
+
+    return _search_vecs(np.vstack(query_vecs), top_k)
+
+
+def _search_vecs(query_vecs: np.ndarray, top_k: int) -> List[List[dict]]:
     try:
         index, metadata = load_index()
     except Exception as e:
         raise FileNotFoundError(f"Failed to load index: {str(e)}")
     
-    try:
-        query_vec = Embedder.encode([query])
-    except Exception as e:
-        raise ValueError(f"Failed to encode query: {str(e)}")
-    
-    if query_vec.shape[1] != index.d:
-        raise ValueError(f"Embedding dimension mismatch: query={query_vec.shape[1]}, index={index.d}")
+    if query_vecs.shape[1] != index.d:
+        raise ValueError(f"Embedding dimension mismatch: query={query_vecs.shape[1]}, index={index.d}")
     
+    # The index is shared between requests, so pass efSearch per call instead of setting it
+    params = None
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(efSearch=max(64, top_k * 4))
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(nprobe=IVFPQ_NPROBE)
+
     try:
-        scores, idxs = index.search(query_vec, min(top_k, index.ntotal))
+        scores, idxs = index.search(query_vecs, min(top_k, index.ntotal), params=params)
     except Exception as e:
         raise ValueError(f"FAISS search failed: {str(e)}")
 
-    results = []
-    for score, idx in zip(scores[0], idxs[0]):
-        if idx < 0 or idx >= len(metadata):
-            continue
-        item = metadata[idx].copy()
-        item["score"] = float(score)
-        results.append(item)
+    all_results = []
+    for row_scores, row_idxs in zip(scores, idxs):
+        results = []
+        for score, idx in zip(row_scores, row_idxs):
+            if idx < 0 or idx >= len(metadata):
+                continue
+            # Build a fresh dict so the cached metadata is never mutated
+            m = metadata[idx]
+            results.append({"id": m["id"], "text": m["text"], "source": m["source"], "score": float(score)})
+        all_results.append(results)
 
-    return results
+    return all_results
 
 
 # -----------------------------
@@ -156,10 +372,25 @@ def build_prompt(question: str, contexts: List[dict]) -> str:
     return prompt
 
 
+def join_contexts(contexts: List[dict], max_chars: int) -> str:
+    """Same as joining all context texts with blank lines and cutting at max_chars,
+    without building the part that would be cut off"""
+    parts = []
+    total = 0
+    for c in contexts:
+        text = c["text"][:max(max_chars - total, 0)]
+        parts.append(text)
+        total += len(text)
+        if total >= max_chars:
+            break
+        total += 2  # "\n\n" separator before the next text
+    return "\n\n".join(parts)[:max_chars]
+
+
 # -----------------------------
 # ANSWER GENERATION (GROQ)
 # -----------------------------
-def generate_answer(question: str, contexts: List[dict]) -> str:
+def build_answer_messages(question: str, contexts: List[dict]) -> List[dict]:
     if not settings.groq_api_key:
         raise ValueError("GROQ_API_KEY is not set. Please set it in your .env file.")
     
@@ -168,21 +399,26 @@ def generate_answer(question: str, contexts: List[dict]) -> str:
     
     if not contexts:
         raise ValueError("Contexts cannot be empty")
-    
+
+    return [
+        {"role": "system", "content": "You are a concise Smart Campus Assistant."},
+        {"role": "user", "content": build_prompt(question, contexts)},
+    ]
+
+
+async def generate_answer_async(question: str, contexts: List[dict]) -> str:
+    """Answer a question from the retrieved contexts, awaiting Groq instead of blocking a worker thread"""
+    messages = build_answer_messages(question, contexts)
+
     try:
-        client = Groq(api_key=settings.groq_api_key)
+        client = Embedder.get_async_groq_client()
     except Exception as e:
         raise ValueError(f"Failed to initialize Groq client: {str(e)}")
 
-    prompt = build_prompt(question, contexts)
-
     try:
-        response = client.chat.completions.create(
-            model=settings.llm_model,   # "llama-3.1-8b-instant"
-            messages=[
-                {"role": "system", "content": "You are a concise Smart Campus Assistant."},
-                {"role": "user", "content": prompt},
-            ],
+        response = await client.chat.completions.create(
+            model=settings.llm_model,
+            messages=messages,
             temperature=0.2,
         )
     except Exception as e:
@@ -194,6 +430,26 @@ def generate_answer(question: str, contexts: List[dict]) -> str:
     return response.choices[0].message.content.strip()
 
 
+async def stream_answer(question: str, contexts: List[dict]) -> AsyncIterator[str]:
+    """Yield the answer token by token as Groq produces it"""
+    messages = build_answer_messages(question, contexts)
+
+    try:
+        client = Embedder.get_async_groq_client()
+        response = await client.chat.completions.create(
+            model=settings.llm_model,
+            messages=messages,
+            temperature=0.2,
+            stream=True,
+        )
+    except Exception as e:
+        raise ValueError(f"Groq API call failed: {str(e)}")
+
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
 # -----------------------------
 # DOCUMENT SUMMARIZATION
 # -----------------------------
@@ -217,7 +473,7 @@ def summarize_document(contexts: List[dict], max_length: int = 500) -> str:
     )
     
     try:
-        client = Groq(api_key=settings.groq_api_key)
+        client = Embedder.get_groq_client()
         response = client.chat.completions.create(
             model=settings.llm_model,
             messages=[
@@ -239,6 +495,17 @@ def summarize_document(contexts: List[dict], max_length: int = 500) -> str:
 # -----------------------------
 # QUIZ GENERATION
 # -----------------------------
+# Compiled once; used to salvage quizzes when the LLM does not return valid JSON
+QUIZ_CONTEXT_CHARS = 6000
+
+_CODE_FENCE_RE = re.compile(r"```(?:json)?\s*")
+_QUESTION_RE = re.compile(
+    r"(?:Question\s*\d+[:.]?\s*|Q\d+[:.]?\s*|^\d+[.)]\s*)(.+?)(?=\n(?:Question|Q\d+|\d+[.)]|$))",
+    re.MULTILINE | re.IGNORECASE | re.DOTALL,
+)
+_OPTION_RE = re.compile(r"[A-D][:.)]\s*.")
+
+
 def generate_quiz(contexts: List[dict], num_questions: int = 5, difficulty: str = "medium", topic: str = None) -> dict:
     """Generate a quiz from the given contexts"""
     if not settings.groq_api_key:
@@ -247,8 +514,8 @@ def generate_quiz(contexts: List[dict], num_questions: int = 5, difficulty: str
     if not contexts:
         raise ValueError("Contexts cannot be empty")
     
-    # Combine all contexts
-    full_text = "\n\n".join([c["text"] for c in contexts])
+    # Combine contexts up to the prompt budget
+    full_text = join_contexts(contexts, QUIZ_CONTEXT_CHARS)
     
     # Build topic-specific prompt
     topic_instruction = ""
@@ -266,12 +533,12 @@ def generate_quiz(contexts: List[dict], num_questions: int = 5, difficulty: str
         f"4. A brief explanation of why the answer is correct\n\n"
         f"IMPORTANT: Format your response as valid JSON only, with this exact structure:\n"
         f'{{"questions": [{{"question": "Your question here", "options": {{"A": "Option A text", "B": "Option B text", "C": "Option C text", "D": "Option D text"}}, "correct": "A", "explanation": "Why this is correct"}}]}}\n\n'
-        f"Content to create questions from:\n{full_text[:6000]}\n\n"
+        f"Content to create questions from:\n{full_text}\n\n"
         f"Generate exactly {num_questions} questions as JSON:"
     )
     
     try:
-        client = Groq(api_key=settings.groq_api_key)
+        client = Embedder.get_groq_client()
         response = client.chat.completions.create(
             model=settings.llm_model,
             messages=[
@@ -286,41 +553,32 @@ def generate_quiz(contexts: List[dict], num_questions: int = 5, difficulty: str
     if not response.choices or not response.choices[0].message.content:
         raise ValueError("Empty response from Groq API")
 
-    import json
-    import re
-    
     response_text = response.choices[0].message.content.strip()
     
     # Try to extract JSON from the response
-    # Look for JSON object
-    json_match = re.search(r'\{[\s\S]*\}', response_text)
-    if json_match:
+    # Look for JSON object (outermost braces)
+    start, end = response_text.find("{"), response_text.rfind("}")
+    if start != -1 and end > start:
         try:
-            quiz_data = json.loads(json_match.group())
-            if "questions" in quiz_data:
+            quiz_data = orjson.loads(response_text[start:end + 1])
+            if isinstance(quiz_data, dict) and "questions" in quiz_data:
                 return quiz_data
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError:
             # Try to fix common JSON issues
             try:
                 # Remove markdown code blocks if present
-                cleaned = re.sub(r'```json\s*', '', response_text)
-                cleaned = re.sub(r'```\s*', '', cleaned)
-                quiz_data = json.loads(cleaned)
-                if "questions" in quiz_data:
+                quiz_data = orjson.loads(_CODE_FENCE_RE.sub("", response_text))
+                if isinstance(quiz_data, dict) and "questions" in quiz_data:
                     return quiz_data
-            except:
+            except orjson.JSONDecodeError:
                 pass
     
     # Fallback: Try to parse questions from text format
     questions = []
-    question_pattern = r'(?:Question\s*\d+[:.]?\s*|Q\d+[:.]?\s*|^\d+[.)]\s*)(.+?)(?=\n(?:Question|Q\d+|\d+[.)]|$))'
-    matches = re.finditer(question_pattern, response_text, re.MULTILINE | re.IGNORECASE | re.DOTALL)
-    
-    for match in list(matches)[:num_questions]:
+    for match in islice(_QUESTION_RE.finditer(response_text), num_questions):
         question_text = match.group(1).strip()
-        # Try to extract options
-        options_match = re.search(r'([A-D])[:.)]\s*(.+?)(?=\n[A-D][:.)]|$)', question_text, re.MULTILINE)
-        if options_match:
+        # Only keep questions that come with options
+        if _OPTION_RE.search(question_text):
             questions.append({
                 "question": question_text.split('\n')[0],
                 "options": {"A": "Option A", "B": "Option B", "C": "Option C", "D": "Option D"},
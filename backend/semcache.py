@@ -0,0 +1,73 @@
+import threading
+import time
+from typing import Any, List
+
+import faiss
+import numpy as np
+
+from backend.config import settings
+
+
+# -----------------------------
+# SEMANTIC ANSWER CACHE
+# -----------------------------
+class SemanticCache:
+    """Caches answers by query embedding, so near-duplicate questions skip search and the LLM.
+
+    Entries belong to one index version (see rag.index_version); a lookup against a
+    newer index empties the cache, and answers built from an older one are not added.
+    """
+
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._index: faiss.IndexFlatIP | None = None
+        # Parallel to the index rows: {"top_k", "answer", "sources", "ts"}
+        self._entries: List[dict[str, Any]] = []
+        self._version: Any = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query_vec: np.ndarray, top_k: int, version: Any) -> dict[str, Any] | None:
+        with self._lock:
+            if version != self._version:
+                # The corpus changed (e.g. ingested from the CLI), so every entry is stale
+                self._index = None
+                self._entries = []
+                self._version = version
+                return None
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, idxs = self._index.search(query_vec, 1)
+            score, idx = float(scores[0, 0]), int(idxs[0, 0])
+            if idx < 0 or score < self.threshold:
+                return None
+            entry = self._entries[idx]
+            if entry["top_k"] != top_k:
+                return None
+            entry["ts"] = time.monotonic()
+            return entry
+
+    def add(self, query_vec: np.ndarray, top_k: int, answer: str, sources: List[dict], version: Any) -> None:
+        with self._lock:
+            if version is None or version != self._version:
+                return  # Answered from an index that has since been replaced
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(query_vec.shape[1])
+            if self._index.ntotal >= self.max_entries:
+                # Evict the least recently used entry; remove_ids shifts later rows down
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]["ts"])
+                self._index.remove_ids(np.array([lru], dtype="int64"))
+                del self._entries[lru]
+            self._index.add(query_vec)
+            self._entries.append(
+                {"top_k": top_k, "answer": answer, "sources": sources, "ts": time.monotonic()}
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index = None
+            self._entries = []
+            self._version = None
+
+
+semantic_cache = SemanticCache(settings.semcache_threshold, settings.semcache_max_entries)
@@ -1,7 +1,21 @@
+import atexit
+import hashlib
 import os
 import requests
 import streamlit as st
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    json_loads = json.loads
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
@@ -13,77 +27,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+
+@st.cache_data
+def load_css() -> str:
+    """Read the stylesheet once; later reruns reuse the cached HTML"""
+    css = (Path(__file__).parent / "styles.css").read_text(encoding="utf-8")
+    return f"<style>\n{css}</style>"
+
+
 # Custom CSS with SKCET branding
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 2.8rem;
-        font-weight: 700;
-        color: #1a237e;
-        margin-bottom: 0.5rem;
-        text-align: center;
-    }
-    .sub-header {
-        font-size: 1.2rem;
-        color: #424242;
-        margin-bottom: 2rem;
-        text-align: center;
-    }
-    .skcet-brand {
-        color: #1a237e;
-        font-weight: 600;
-    }
-    .stButton>button {
-        width: 100%;
-        border-radius: 8px;
-        background-color: #1a237e;
-        color: white;
-        font-weight: 600;
-        padding: 0.5rem 1rem;
-    }
-    .stButton>button:hover {
-        background-color: #283593;
-    }
-    .chat-message {
-        padding: 1rem;
-        border-radius: 8px;
-        margin: 0.5rem 0;
-    }
-    .user-message {
-        background-color: #e3f2fd;
-        margin-left: 20%;
-        padding: 1rem;
-        border-radius: 8px;
-    }
-    .assistant-message {
-        background-color: #f5f5f5;
-        margin-right: 20%;
-        padding: 1rem;
-        border-radius: 8px;
-    }
-    .quiz-question {
-        padding: 1rem;
-        background-color: #fff;
-        border-left: 4px solid #1a237e;
-        margin: 1rem 0;
-        border-radius: 4px;
-    }
-    .file-card {
-        padding: 1rem;
-        background-color: #f8f9fa;
-        border-radius: 8px;
-        margin: 0.5rem 0;
-        border: 1px solid #e0e0e0;
-    }
-    .info-box {
-        padding: 1rem;
-        background-color: #e8eaf6;
-        border-left: 4px solid #1a237e;
-        border-radius: 4px;
-        margin: 1rem 0;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Initialize session state
 if "chat_history" not in st.session_state:
@@ -98,120 +51,263 @@ if "quiz_checked" not in st.session_state:
     st.session_state.quiz_checked = {}
 
 
-def format_file_size(size_bytes):
-    """Format file size in human-readable format"""
-    if size_bytes < 1024:
-        return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.1f} KB"
-    else:
-        return f"{size_bytes / (1024 * 1024):.1f} MB"
+@st.cache_resource
+def get_session(retries: int = 3):
+    """Shared HTTP session, kept across reruns so backend connections are reused"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=retries, backoff_factor=0.3, status_forcelist=[502, 503, 504]) if retries else 0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    atexit.register(session.close)
+    return session
 
 
-def call_query_api(question: str, top_k: int = 4):
-    """Call the query API"""
-    try:
-        resp = requests.post(
-            f"{BACKEND_URL}/query",
-            json={"question": question, "top_k": top_k},
-            timeout=60
-        )
-        resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.ConnectionError:
-        raise RuntimeError("Unable to connect to the server. Please make sure the application is running.")
-    except requests.exceptions.Timeout:
-        raise RuntimeError("Request took too long. Please try again.")
-    except requests.exceptions.HTTPError:
-        try:
-            error_data = resp.json()
-            detail = error_data.get("detail", "An error occurred")
-            if "No context found" in detail or "Index or metadata missing" in detail:
-                raise RuntimeError("No documents found. Please upload and process your documents first.")
-            elif "GROQ_API_KEY" in detail:
-                raise RuntimeError("Configuration error. Please contact support.")
-            else:
-                raise RuntimeError("Unable to process your question. Please try again.")
-        except RuntimeError:
-            raise
-        except:
-            raise RuntimeError("An error occurred. Please try again.")
+# (divisor, unit, decimals), indexed by floor(log2(size) / 10)
+_SIZE_UNITS = [(1, "B", 0), (1024, "KB", 1), (1024 ** 2, "MB", 1), (1024 ** 3, "GB", 2)]
+
+
+def format_file_size(size_bytes):
+    """Format file size in human-readable format"""
+    scale = min(max(0, (size_bytes.bit_length() - 1) // 10), len(_SIZE_UNITS) - 1)
+    divisor, unit, decimals = _SIZE_UNITS[scale]
+    return f"{size_bytes / divisor:.{decimals}f} {unit}" if scale else f"{size_bytes} B"
 
 
 def upload_file_to_backend(uploaded_file):
     """Upload file to backend"""
     try:
-        files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-        resp = requests.post(f"{BACKEND_URL}/upload", files=files, timeout=60)
+        # Pass the file object itself rather than a getvalue() copy of its bytes
+        uploaded_file.seek(0)
+        files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
+        resp = get_session().post(f"{BACKEND_URL}/upload", files=files, timeout=60)
         resp.raise_for_status()
         return resp.json()
-    except requests.exceptions.HTTPError:
+    except requests.exceptions.HTTPError as exc:
         try:
-            error_data = resp.json()
-            detail = error_data.get("detail", "Upload failed")
-            if "not supported" in detail.lower():
-                raise RuntimeError("This file type is not supported. Please upload PDF, Word, PowerPoint, or text files.")
-            else:
-                raise RuntimeError("Failed to upload file. Please try again.")
-        except:
+            detail = str(exc.response.json().get("detail", "Upload failed"))
+        except (ValueError, requests.exceptions.JSONDecodeError):
+            raise RuntimeError("Failed to upload file. Please try again.")
+        if "not supported" in detail.lower():
+            raise RuntimeError("This file type is not supported. Please upload PDF, Word, PowerPoint, or text files.")
+        else:
             raise RuntimeError("Failed to upload file. Please try again.")
     except Exception:
         raise RuntimeError("Failed to upload file. Please check your connection and try again.")
 
 
-def call_summarize_api(query: str = None, max_length: int = 500):
-    """Call the summarize API"""
+def upload_files_to_backend(uploaded_files):
+    """Upload several files to backend in one request"""
     try:
-        resp = requests.post(
-            f"{BACKEND_URL}/summarize",
-            json={"query": query, "max_length": max_length},
-            timeout=60
-        )
+        files = []
+        for uploaded_file in uploaded_files:
+            uploaded_file.seek(0)
+            files.append(("files", (uploaded_file.name, uploaded_file, uploaded_file.type)))
+        resp = get_session().post(f"{BACKEND_URL}/upload/batch", files=files, timeout=120)
         resp.raise_for_status()
         return resp.json()
-    except requests.exceptions.ConnectionError:
-        raise RuntimeError("Unable to connect to the server. Please make sure the application is running.")
+    except requests.exceptions.HTTPError as exc:
+        try:
+            detail = str(exc.response.json().get("detail", "Upload failed"))
+        except (ValueError, requests.exceptions.JSONDecodeError):
+            raise RuntimeError("Failed to upload files. Please try again.")
+        if "not supported" in detail.lower():
+            raise RuntimeError("One of the files is not supported. Please upload PDF, Word, PowerPoint, or text files.")
+        else:
+            raise RuntimeError("Failed to upload files. Please try again.")
     except Exception:
-        raise RuntimeError("Unable to generate summary. Please try again.")
+        raise RuntimeError("Failed to upload files. Please check your connection and try again.")
 
 
-def call_quiz_api(query: str = None, num_questions: int = 5, difficulty: str = "medium"):
-    """Call the quiz API"""
+def _send_json(path: str, payload: dict | None, timeout: int):
+    resp = get_session().post(
+        f"{BACKEND_URL}{path}",
+        data=None if payload is None else json_dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=timeout
+    )
+    resp.raise_for_status()
+    return json_loads(resp.content)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _send_json_cached(path: str, payload: dict | None, timeout: int):
+    # Only successful responses are cached; exceptions propagate every time
+    return _send_json(path, payload, timeout)
+
+
+def _translate_error(response, fallback: str) -> RuntimeError:
+    """Turn a backend error response into a user-facing message"""
     try:
-        resp = requests.post(
-            f"{BACKEND_URL}/quiz",
-            json={"query": query, "num_questions": num_questions, "difficulty": difficulty},
-            timeout=60
-        )
-        resp.raise_for_status()
-        return resp.json()
+        detail = str(response.json().get("detail", ""))
+    except (ValueError, requests.exceptions.JSONDecodeError):
+        return RuntimeError(fallback)
+    if "No context found" in detail or "Index or metadata missing" in detail:
+        return RuntimeError("No documents found. Please upload and process your documents first.")
+    elif "GROQ_API_KEY" in detail:
+        return RuntimeError("Configuration error. Please contact support.")
+    return RuntimeError(fallback)
+
+
+def _post_json(path: str, payload: dict | None = None, timeout: int = 60,
+               error: str = "An error occurred. Please try again.", cached: bool = False):
+    """POST JSON to the backend, raising RuntimeError with a user-facing message on failure"""
+    send = _send_json_cached if cached else _send_json
+    try:
+        return send(path, payload, timeout)
     except requests.exceptions.ConnectionError:
         raise RuntimeError("Unable to connect to the server. Please make sure the application is running.")
-    except Exception:
-        raise RuntimeError("Unable to generate quiz. Please try again.")
+    except requests.exceptions.Timeout:
+        raise RuntimeError("Request took too long. Please try again.")
+    except requests.exceptions.HTTPError as exc:
+        raise _translate_error(exc.response, error)
+    except (requests.exceptions.RequestException, ValueError):
+        raise RuntimeError(error)
+
+
+def call_query_api(question: str, top_k: int = 4):
+    """Call the query API (repeated questions are answered from cache)"""
+    return _post_json("/query", {"question": question, "top_k": top_k},
+                      error="Unable to process your question. Please try again.", cached=True)
+
+
+def call_summarize_api(query: str = None, max_length: int = 500):
+    """Call the summarize API (repeated requests are answered from cache)"""
+    return _post_json("/summarize", {"query": query, "max_length": max_length},
+                      error="Unable to generate summary. Please try again.", cached=True)
+
+
+def call_quiz_api(query: str = None, num_questions: int = 5, difficulty: str = "medium"):
+    """Call the quiz API"""
+    return _post_json("/quiz", {"query": query, "num_questions": num_questions, "difficulty": difficulty},
+                      error="Unable to generate quiz. Please try again.")
+
+
+def clear_cached_responses():
+    """Forget cached answers and summaries, e.g. once the documents change"""
+    _send_json_cached.clear()
 
 
 def call_ingest_api():
     """Trigger document ingestion"""
-    try:
-        resp = requests.post(f"{BACKEND_URL}/ingest", timeout=120)
-        resp.raise_for_status()
-        return resp.json()
-    except Exception:
-        raise RuntimeError("Failed to process documents. Please try again.")
+    result = _post_json("/ingest", timeout=120, error="Failed to process documents. Please try again.")
+    # Answers from the previous document set are stale now
+    clear_cached_responses()
+    return result
 
 
-def check_backend_status():
-    """Check if backend is available"""
+@st.cache_data(ttl=15, show_spinner=False)
+def check_backend_status() -> bool:
+    """Check if backend is available (cached briefly so reruns don't re-probe)"""
     try:
-        resp = requests.get(f"{BACKEND_URL}/health", timeout=5)
+        # No retries: a refused connection should report offline at once, not after backoff
+        resp = get_session(retries=0).get(f"{BACKEND_URL}/health", timeout=1.5)
         return resp.status_code == 200
-    except:
+    except requests.exceptions.RequestException:
         return False
 
 
+def question_id(q) -> str:
+    """Stable id for a quiz question, derived from its text and options"""
+    options = q.get("options") or {}
+    content = q.get("question", "") + "\x1f" + "\x1f".join(f"{k}={v}" for k, v in options.items())
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+
+def require_backend(backend_online: bool) -> None:
+    """Show the offline notice at the top of a tab"""
+    if not backend_online:
+        st.warning("⚠️ System is offline. Please start the backend server first.")
+        st.info("💡 Check the sidebar for instructions on how to start the server.")
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def list_documents(mtime_ns: int):
+    """Names and sizes of uploaded documents; keyed on the folder mtime so changes show up"""
+    return [
+        (f.name, f.stat().st_size)
+        for f in Path("data").glob("*")
+        if f.is_file() and not f.name.startswith(".")
+    ]
+
+
+def show_answer_feedback(slot, q, answer: str) -> None:
+    """Write the verdict and explanation for one quiz answer into its slot"""
+    correct = q["_correct_norm"]
+    with slot.container():
+        if answer.upper().strip() == correct:
+            st.success(f"✅ **Correct!** {correct} is the right answer.")
+        else:
+            st.error(f"❌ **Incorrect.** The correct answer is **{correct}**.")
+        
+        explanation = q.get('explanation', 'No explanation provided.')
+        if explanation:
+            st.info(f"**Explanation:** {explanation}")
+
+
+@st.fragment
+def render_quiz_answer(i: int, q) -> None:
+    """Answer picker and check button for one quiz question.
+
+    Runs as a fragment, so picking or checking an answer only reruns this question.
+    """
+    options = q["options"]
+    answer_key = f"quiz_answer_{q['_qid']}"
+    check_key = f"quiz_check_{q['_qid']}"
+    
+    # Radio button for answer selection
+    current_answer = st.session_state.quiz_answers.get(answer_key)
+    default_index = st.session_state.current_quiz["option_index"][i - 1].get(current_answer)
+    
+    selected = st.radio(
+        "Select your answer:",
+        options=st.session_state.current_quiz["option_keys"][i - 1],
+        format_func=lambda x: f"{x}: {options[x]}",
+        key=f"quiz_radio_{q['_qid']}",
+        index=default_index
+    )
+    if selected:
+        st.session_state.quiz_answers[answer_key] = selected
+    
+    # Check Answer button
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        check_button = st.button(f"✓ Check Answer", key=check_key, use_container_width=True)
+    
+    # Feedback is written in place below the button
+    feedback = st.empty()
+    if check_button:
+        if selected:
+            st.session_state.quiz_checked[check_key] = True
+            show_answer_feedback(feedback, q, selected)
+        else:
+            feedback.warning("⚠️ Please select an answer first!")
+    elif st.session_state.quiz_checked.get(check_key, False) and selected:
+        # Keep showing the result of an earlier check
+        show_answer_feedback(feedback, q, selected)
+
+
+# Main header (painted before the sidebar health probe runs)
+st.markdown('<p class="main-header">🎓 SKCET Smart Campus Assistant</p>', unsafe_allow_html=True)
+st.markdown('<p class="sub-header"> AI-powered study companion for efficient learning</p>', unsafe_allow_html=True)
+
+# Info box
+st.markdown("""
+<div class="info-box">
+    <strong>Welcome!</strong> Upload your course materials (PDFs, documents, PPTs) and get instant answers, 
+    summaries, and practice quizzes powered by AI.
+</div>
+""", unsafe_allow_html=True)
+
+
 # Sidebar
 with st.sidebar:
+    # Probed once per rerun, before anything uses it
+    backend_online = check_backend_status()
+
     st.markdown("## 🎓 SKCET")
     st.markdown("### Smart Campus Assistant")
     st.markdown("---")
@@ -224,6 +320,7 @@ with st.sidebar:
             with st.spinner("Processing..."):
                 try:
                     result = call_ingest_api()
+                    check_backend_status.clear()
                     st.success("Documents processed successfully!")
                     st.balloons()
                 except Exception as e:
@@ -231,6 +328,10 @@ with st.sidebar:
         else:
             st.error("System is offline. Please start the server first.")
     
+    if st.button("🧹 Clear Cached Answers", use_container_width=True, help="Ask the server again instead of reusing earlier answers"):
+        clear_cached_responses()
+        st.success("Cached answers cleared.")
+    
     st.markdown("---")
     st.markdown("### 📖 How to Use")
     st.markdown("""
@@ -251,8 +352,7 @@ with st.sidebar:
     [Visit Website](https://skcet.ac.in/)
     """)
 
-     # Status check
-    backend_online = check_backend_status()
+    # Status check
     if backend_online:
         st.success("✅ System Ready")
     else:
@@ -276,18 +376,6 @@ with st.sidebar:
     st.markdown("---")
 
 
-# Main header
-st.markdown('<p class="main-header">🎓 SKCET Smart Campus Assistant</p>', unsafe_allow_html=True)
-st.markdown('<p class="sub-header"> AI-powered study companion for efficient learning</p>', unsafe_allow_html=True)
-
-# Info box
-st.markdown("""
-<div class="info-box">
-    <strong>Welcome!</strong> Upload your course materials (PDFs, documents, PPTs) and get instant answers, 
-    summaries, and practice quizzes powered by AI.
-</div>
-""", unsafe_allow_html=True)
-
 # Tabs
 tab1, tab2, tab3, tab4 = st.tabs(["📁 Upload Documents", "💬 Ask Questions", "📝 Summarize", "🧪 Generate Quiz"])
 
@@ -317,6 +405,25 @@ with tab1:
     
     if uploaded_files:
         st.markdown("### Ready to Upload")
+        if st.button(f"📤 Upload All ({len(uploaded_files)})", type="primary", use_container_width=True):
+            if backend_online:
+                with st.spinner(f"Uploading {len(uploaded_files)} files..."):
+                    try:
+                        result = upload_files_to_backend(uploaded_files)
+                        list_documents.clear()
+                        st.success("✅ All files uploaded successfully!")
+                        # Process everything once after the batch upload
+                        with st.spinner("Processing documents..."):
+                            try:
+                                ingest_result = call_ingest_api()
+                                st.success("✅ Documents processed and ready!")
+                                st.balloons()
+                            except Exception as e:
+                                st.warning("Uploaded but processing failed. Click 'Process Documents' in sidebar.")
+                    except Exception as e:
+                        st.error(str(e))
+            else:
+                st.error("System offline")
         for uploaded_file in uploaded_files:
             with st.container():
                 col1, col2, col3 = st.columns([3, 1, 1])
@@ -331,6 +438,7 @@ with tab1:
                             with st.spinner(f"Uploading {uploaded_file.name}..."):
                                 try:
                                     result = upload_file_to_backend(uploaded_file)
+                                    list_documents.clear()
                                     st.success("✅ Uploaded successfully!")
                                     # Auto-process after upload
                                     with st.spinner("Processing document..."):
@@ -353,10 +461,10 @@ with tab1:
     st.markdown("### 📚 Your Documents")
     data_dir = Path("data")
     if data_dir.exists():
-        files = [f for f in data_dir.glob("*") if f.is_file() and not f.name.startswith(".")]
+        files = list_documents(data_dir.stat().st_mtime_ns)
         if files:
-            for file in files:
-                st.markdown(f'<div class="file-card">📄 **{file.name}** *({format_file_size(file.stat().st_size)})*</div>', unsafe_allow_html=True)
+            for name, size in files:
+                st.markdown(f'<div class="file-card">📄 **{name}** *({format_file_size(size)})*</div>', unsafe_allow_html=True)
         else:
             st.info("👆 Upload your first document above to get started!")
     else:
@@ -368,39 +476,22 @@ with tab2:
     st.header("Ask Questions")
     st.markdown("Ask questions about your course materials and get instant answers.")
     
-    if not backend_online:
-        st.warning("⚠️ System is offline. Please start the backend server first.")
-        st.info("💡 Check the sidebar for instructions on how to start the server.")
+    require_backend(backend_online)
     
     # Chat interface
-    if st.session_state.chat_history:
-        st.markdown("### Conversation History")
-        for i, message in enumerate(st.session_state.chat_history):
-            if message["role"] == "user":
-                st.markdown(f'<div class="chat-message user-message"><strong>You:</strong> {message["content"]}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown(f'<div class="chat-message assistant-message"><strong>Assistant:</strong> {message["content"]}</div>', unsafe_allow_html=True)
-                if "sources" in message and message["sources"]:
-                    with st.expander("📚 View Sources"):
-                        for src in message["sources"][:3]:
-                            st.markdown(f"**{src.get('source', 'Document')}**")
-                            st.markdown(f"_{src.get('text', '')[:200]}..._")
-        st.markdown("---")
-    
-    # Input area
-    col1, col2 = st.columns([5, 1])
-    
-    with col1:
-        user_question = st.text_input(
-            "Ask a question about your documents",
-            placeholder="e.g., What are the main topics covered?",
-            label_visibility="collapsed"
-        )
+    for message in st.session_state.chat_history:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message.get("sources"):
+                with st.expander("📚 View Sources"):
+                    for src in message["sources"][:3]:
+                        st.markdown(f"**{src.get('source', 'Document')}**")
+                        st.markdown(f"_{src.get('text', '')[:200]}..._")
     
-    with col2:
-        ask_button = st.button("Ask ➤", use_container_width=True, type="primary")
+    # Input area; chat_input only reruns the script on submit, not on every keystroke
+    user_question = st.chat_input("Ask a question about your documents")
     
-    if ask_button and user_question.strip():
+    if user_question and user_question.strip():
         if backend_online:
             with st.spinner("Thinking..."):
                 try:
@@ -429,23 +520,24 @@ with tab3:
     st.header("Document Summarization")
     st.markdown("Generate concise summaries of your course materials.")
     
-    if not backend_online:
-        st.warning("⚠️ System is offline. Please start the backend server first.")
-        st.info("💡 Check the sidebar for instructions on how to start the server.")
-    
-    col1, col2 = st.columns([2, 1])
+    require_backend(backend_online)
     
-    with col1:
-        summary_query = st.text_input(
-            "Focus area (optional)",
-            placeholder="e.g., machine learning concepts, or leave empty for general summary",
-            help="Enter a specific topic to focus the summary, or leave empty for a general summary"
-        )
-    
-    with col2:
-        max_length = st.slider("Summary Length", 20, 1000, 500, 50)
+    with st.form("summary_form"):
+        col1, col2 = st.columns([2, 1])
+        
+        with col1:
+            summary_query = st.text_input(
+                "Focus area (optional)",
+                placeholder="e.g., machine learning concepts, or leave empty for general summary",
+                help="Enter a specific topic to focus the summary, or leave empty for a general summary"
+            )
+        
+        with col2:
+            max_length = st.slider("Summary Length", 20, 1000, 500, 50)
+        
+        summary_button = st.form_submit_button("📝 Generate Summary", use_container_width=True, type="primary")
     
-    if st.button("📝 Generate Summary", use_container_width=True, type="primary"):
+    if summary_button:
         if backend_online:
             with st.spinner("Generating summary..."):
                 try:
@@ -474,27 +566,28 @@ with tab4:
     st.header("Practice Quiz Generator")
     st.markdown("Test your knowledge with AI-generated quizzes from your materials.")
     
-    if not backend_online:
-        st.warning("⚠️ System is offline. Please start the backend server first.")
-        st.info("💡 Check the sidebar for instructions on how to start the server.")
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        quiz_query = st.text_input(
-            "Topic (optional)",
-            placeholder="e.g., data structures, or leave empty for general quiz",
-            help="Enter a specific topic, or leave empty for a general quiz"
-        )
+    require_backend(backend_online)
     
-    with col2:
-        num_questions = st.slider("Number of Questions", 3, 15, 5, 1)
-    
-    with col3:
-        difficulty = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"], index=1)
+    with st.form("quiz_form"):
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            quiz_query = st.text_input(
+                "Topic (optional)",
+                placeholder="e.g., data structures, or leave empty for general quiz",
+                help="Enter a specific topic, or leave empty for a general quiz"
+            )
+        
+        with col2:
+            num_questions = st.slider("Number of Questions", 3, 15, 5, 1)
+        
+        with col3:
+            difficulty = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"], index=1)
+        
+        # Generate quiz button
+        generate_button = st.form_submit_button("🧪 Generate Quiz", use_container_width=True, type="primary")
     
-    # Generate quiz button
-    if st.button("🧪 Generate Quiz", use_container_width=True, type="primary", key="generate_quiz_btn"):
+    if generate_button:
         if backend_online:
             with st.spinner("Generating quiz..."):
                 try:
@@ -508,12 +601,28 @@ with tab4:
                     questions = quiz.get("questions", [])
                     
                     if questions:
+                        # Normalize the correct answers once rather than on every render, and
+                        # give each question a stable id for its widget keys
+                        seen_qids = set()
+                        for q in questions:
+                            q["_correct_norm"] = (q.get("correct") or "").upper().strip()
+                            qid = question_id(q)
+                            while qid in seen_qids:  # Identical questions still need distinct keys
+                                qid = hashlib.blake2b(qid.encode(), digest_size=8).hexdigest()
+                            seen_qids.add(qid)
+                            q["_qid"] = qid
                         # Store quiz in session state
                         st.session_state.current_quiz = {
                             "questions": questions,
                             "topic": quiz_query if quiz_query.strip() else "General",
                             "difficulty": difficulty,
-                            "sources": result.get("sources", [])
+                            "sources": result.get("sources", []),
+                            # Option order and positions, computed once instead of on every rerun
+                            "option_keys": [list(q.get("options", {})) for q in questions],
+                            "option_index": [
+                                {key: idx for idx, key in enumerate(q.get("options", {}))}
+                                for q in questions
+                            ],
                         }
                         # Reset answers when new quiz is generated
                         st.session_state.quiz_answers = {}
@@ -542,76 +651,8 @@ with tab4:
                 st.markdown(f"#### Question {i}")
                 st.markdown(f"**{q.get('question', 'N/A')}**")
                 
-                options = q.get("options", {})
-                if options:
-                    # Initialize answer tracking
-                    answer_key = f"quiz_answer_{i}"
-                    check_key = f"quiz_check_{i}"
-                    
-                    if answer_key not in st.session_state.quiz_answers:
-                        st.session_state.quiz_answers[answer_key] = None
-                    if check_key not in st.session_state.quiz_checked:
-                        st.session_state.quiz_checked[check_key] = False
-                    
-                    # Radio button for answer selection
-                    current_answer = st.session_state.quiz_answers.get(answer_key)
-                    default_index = None
-                    if current_answer and current_answer in options:
-                        default_index = list(options.keys()).index(current_answer)
-                    
-                    selected = st.radio(
-                        "Select your answer:",
-                        options=list(options.keys()),
-                        format_func=lambda x: f"{x}: {options[x]}",
-                        key=f"quiz_radio_{i}",
-                        index=default_index
-                    )
-                    
-                    # Update selected answer in session state immediately
-                    if selected:
-                        st.session_state.quiz_answers[answer_key] = selected
-                    
-                    # Check Answer button
-                    col1, col2 = st.columns([1, 4])
-                    with col1:
-                        check_button = st.button(f"✓ Check Answer", key=check_key, use_container_width=True)
-                    
-                    # Handle button click and show result immediately
-                    if check_button:
-                        current_selected = st.session_state.quiz_answers.get(answer_key) or selected
-                        if current_selected:
-                            st.session_state.quiz_checked[check_key] = True
-                            st.session_state.quiz_answers[answer_key] = current_selected
-                            
-                            # Show result immediately
-                            correct = q.get("correct", "").upper().strip()
-                            selected_upper = current_selected.upper().strip()
-                            
-                            if selected_upper == correct:
-                                st.success(f"✅ **Correct!** {correct} is the right answer.")
-                            else:
-                                st.error(f"❌ **Incorrect.** The correct answer is **{correct}**.")
-                            
-                            explanation = q.get('explanation', 'No explanation provided.')
-                            if explanation:
-                                st.info(f"**Explanation:** {explanation}")
-                        else:
-                            st.warning("⚠️ Please select an answer first!")
-                    elif st.session_state.quiz_checked.get(check_key, False):
-                        # Show previous result if already checked (persists after rerun)
-                        prev_answer = st.session_state.quiz_answers.get(answer_key)
-                        if prev_answer:
-                            correct = q.get("correct", "").upper().strip()
-                            prev_upper = prev_answer.upper().strip()
-                            
-                            if prev_upper == correct:
-                                st.success(f"✅ **Correct!** {correct} is the right answer.")
-                            else:
-                                st.error(f"❌ **Incorrect.** The correct answer is **{correct}**.")
-                            
-                            explanation = q.get('explanation', 'No explanation provided.')
-                            if explanation:
-                                st.info(f"**Explanation:** {explanation}")
+                if q.get("options"):
+                    render_quiz_answer(i, q)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
                 st.markdown("---")